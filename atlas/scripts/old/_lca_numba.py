@@ -0,0 +1,37 @@
+"""Compiled kernel for the LCA ancestor walk over the Tree parent array."""
+
+try:
+    from numba import njit
+except ImportError:
+    # run the kernel as a plain interpreted loop when numba is unavailable
+    def njit(*args, **kwargs):
+        def wrap(func):
+            return func
+
+        if args and callable(args[0]):
+            return args[0]
+        return wrap
+
+
+@njit(cache=True)
+def lca_core(parent, taxa_ids, counts, count_target):
+    """Walk each taxon's ancestors, counting visits until one reaches count_target.
+
+    Args:
+        parent (numpy.ndarray): int32 parent index per node; root is index 0
+        taxa_ids (numpy.ndarray): int32 node indexes to walk, best hit first
+        counts (numpy.ndarray): int32 scratch buffer sized to the node count; zeroed here
+        count_target (float): visit count at which a node is returned as the LCA
+
+    Returns:
+        int: node index of the LCA; 0 (the root) when no node reaches the target
+    """
+    counts[:] = 0
+    for taxon in taxa_ids:
+        i = taxon
+        while i != 0:
+            counts[i] += 1
+            if counts[i] >= count_target:
+                return i
+            i = parent[i]
+    return 0
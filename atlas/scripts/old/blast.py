@@ -1,37 +1,76 @@
-import bisect
 import contextlib
+import functools
+import heapq
 import logging
+import multiprocessing
 import sqlite3
+import sys
 from collections import Counter, OrderedDict, defaultdict, deque
 from itertools import groupby
 
+import numpy as np
+import pandas as pd
+
 from atlas import BLAST6, TAX_LEVELS
-from atlas.utils import gzopen, index_of_list_items, nettleton_pvalue
+from atlas._lca_numba import lca_core
+from atlas.utils import nettleton_pvalue, nettleton_pvalue_from_counts
 
+# contigs frequently repeat the same ORF taxonomy profile
+_nettleton_pvalue_cached = functools.lru_cache(maxsize=200000)(nettleton_pvalue)
 
-class Node(object):
-    def __init__(self, taxonomy, node_id, parent_id, tax_level):
-        """Represents a node within a tree.
 
-        Args:
-            taxonomy (str): taxonomy name or ID
-            node_id (str): taxonomy ID
-            parent_id (str): taxonomy ID of parent
-            tax_level (str): the taxonomic level for this node_id
+def _iter_blast_rows(
+    blast_tab, min_identity, min_bitscore, min_length, max_evalue, chunksize=500000
+):
+    """Yields (row, passed) for each row of a BLAST tabular file, plain or gzipped.
 
-        """
-        # the current node's string ID
-        self.taxonomy = taxonomy
-        # the current node's digit ID
-        self.node_id = node_id
-        self.parent_id = parent_id
-        self.tax_level = tax_level
+    Rows are read in large chunks with pandas and the numeric filters are applied
+    vectorized per chunk, so the per-HSP Python float/int conversions disappear.
+    Failing rows are still yielded (with ``passed`` False) because downstream
+    grouping records an unclassified entry even for fully filtered ORFs.
+
+    Args:
+        blast_tab (str): file path to blast TSV file
+        min_identity (int): minimum allowable percent ID of BLAST hit
+        min_bitscore (int): minimum allowable bitscore of BLAST hit; 0 disables
+        min_length (int): minimum allowable BLAST alignment length
+        max_evalue (float): maximum allowable e-value of BLAST hit
+        chunksize (Optional[int]): rows to read per chunk
+
+    Yields:
+        tuple: (list of tab-separated tokens with the contig column first, bool)
+    """
+    # column offsets within the raw row: contig plus the BLAST6 fields
+    pident_col = 1 + BLAST6.index("pident")
+    length_col = 1 + BLAST6.index("length")
+    evalue_col = 1 + BLAST6.index("evalue")
+    bitscore_col = 1 + BLAST6.index("bitscore")
+    try:
+        chunks = pd.read_csv(
+            blast_tab, sep="\t", header=None, dtype=str, chunksize=chunksize
+        )
+    except pd.errors.EmptyDataError:
+        # a sample without hits writes an empty table
+        return
+    for chunk in chunks:
+        passed = (
+            (pd.to_numeric(chunk.iloc[:, length_col]).to_numpy() >= min_length)
+            & (pd.to_numeric(chunk.iloc[:, pident_col]).to_numpy() >= min_identity)
+            & (pd.to_numeric(chunk.iloc[:, evalue_col]).to_numpy() <= max_evalue)
+        )
+        if min_bitscore:
+            passed &= (
+                pd.to_numeric(chunk.iloc[:, bitscore_col]).to_numpy() >= min_bitscore
+            )
+        yield from zip(chunk.to_numpy().tolist(), passed.tolist())
 
 
 class Tree(object):
     def __init__(self, tree_file):
-        """Builds reference dictionary of Taxonomy Name, Taxonomy ID, and Parent Taxonomy ID."""
-        self.tree = defaultdict(dict)
+        """Builds parallel arrays of Taxonomy Name, Parent, Depth, and Tax Level,
+        indexed by a dense integer ID per Taxonomy ID."""
+        # taxonomy ID to (name, parent ID, tax level); consumed by _build_arrays
+        self._nodes = {}
 
         with open(tree_file) as tree_fh:
             for line in tree_fh:
@@ -44,10 +83,165 @@ class Tree(object):
                         % line.strip()
                     )
                     continue
-                self.add_node(toks[1], toks[0], toks[2], toks[3])
+                # intern the IDs so every parent reference, id_of key, and
+                # node_ids entry shares one string object per taxonomy with a
+                # memoized hash
+                self.add_node(toks[1], sys.intern(toks[0]), sys.intern(toks[2]), toks[3])
+        self._build_arrays()
+        # many ORFs share the same small set of top hits; memoize per hit set
+        self._lca_cached = functools.lru_cache(maxsize=200000)(self._lca_impl)
+        self._lca_consensus_cached = functools.lru_cache(maxsize=200000)(
+            self._lca_consensus_impl
+        )
+        self._lca_star_cached = functools.lru_cache(maxsize=200000)(self._lca_star_impl)
+
+    def _build_arrays(self):
+        """Flattens the pending node mapping into parallel arrays indexed by a dense
+        integer ID.
+
+        Ancestor walks then become integer hops through ``self.parent`` rather than
+        per-node dictionary lookups. Index 0 is always the root ("1"), so walks
+        terminate on ``i == 0``. Names and tax levels live in the ``name`` and
+        ``tax_level`` arrays, addressed through ``id_of``.
+        """
+        # root first so ancestor walks can terminate on index 0
+        self.id_of = {"1": 0}
+        for node_id in self._nodes:
+            if node_id not in self.id_of:
+                self.id_of[node_id] = len(self.id_of)
+        size = len(self.id_of)
+        # index to taxonomy ID; the inverse of id_of
+        self.node_ids = [None] * size
+        for node_id, idx in self.id_of.items():
+            self.node_ids[idx] = node_id
+        self.parent = np.zeros(size, dtype=np.int32)
+        self.depth = np.zeros(size, dtype=np.int32)
+        self.name = np.empty(size, dtype=object)
+        self.tax_level = np.empty(size, dtype=object)
+        for node_id, (taxonomy, parent_id, tax_level) in self._nodes.items():
+            idx = self.id_of[node_id]
+            self.name[idx] = taxonomy
+            self.tax_level[idx] = tax_level
+            # parents missing from the tree collapse onto the root
+            self.parent[idx] = self.id_of.get(parent_id, 0)
+        self.parent[0] = 0
+        # the node mapping is fully represented by the arrays now
+        del self._nodes
+        # scratch buffer reused across lca calls to avoid a per-call allocation
+        self._lca_counts = np.zeros(size, dtype=np.int32)
+        # depths and full root-first lineage tuples in one breadth-first pass over
+        # a children adjacency, so parents are always finished before their
+        # children and no node is walked more than once
+        parent_of = self.parent.tolist()
+        depth = self.depth
+        children = defaultdict(list)
+        for idx in range(1, size):
+            children[parent_of[idx]].append(idx)
+        self.lineage_of = {0: (0,)}
+        lineage_of = self.lineage_of
+        queue = deque(children[0])
+        while queue:
+            idx = queue.popleft()
+            parent_idx = parent_of[idx]
+            depth[idx] = depth[parent_idx] + 1
+            lineage_of[idx] = lineage_of[parent_idx] + (idx,)
+            queue.extend(children[idx])
+        # Euler-tour entry/exit counters; node b is in a's subtree exactly when
+        # tour_in[a] <= tour_in[b] < tour_out[a], making ancestor tests O(1)
+        self.tour_in = np.zeros(size, dtype=np.int32)
+        self.tour_out = np.zeros(size, dtype=np.int32)
+        tour_in = self.tour_in
+        tour_out = self.tour_out
+        clock = 0
+        stack = [(0, False)]
+        while stack:
+            idx, exiting = stack.pop()
+            if exiting:
+                tour_out[idx] = clock
+                continue
+            tour_in[idx] = clock
+            clock += 1
+            stack.append((idx, True))
+            stack.extend((child, False) for child in children[idx])
+        # children adjacency retained for the lazily built pairwise-LCA index
+        self._children = children
+        self._euler_tour = None
+
+    def _build_rmq(self):
+        """Builds the Euler tour and sparse table answering pairwise LCA in O(1).
+
+        Built lazily on the first :func:`lca_pair` call since the sparse table
+        costs O(n log n) memory.
+        """
+        size = len(self.node_ids)
+        tour = []
+        first = np.full(size, -1, dtype=np.int32)
+        children = self._children
+        # iterative Euler tour: each node is appended on entry and again after
+        # returning from each child
+        stack = [(0, 0)]
+        while stack:
+            node, child_pos = stack.pop()
+            if first[node] == -1:
+                first[node] = len(tour)
+            tour.append(node)
+            node_children = children[node]
+            if child_pos < len(node_children):
+                stack.append((node, child_pos + 1))
+                stack.append((node_children[child_pos], 0))
+        self._euler_tour = np.array(tour, dtype=np.int32)
+        self._euler_first = first
+        tour_depths = self.depth[self._euler_tour]
+        # sparse table of argmin-depth tour positions over power-of-two windows
+        tour_len = len(tour)
+        levels = max(tour_len.bit_length(), 1)
+        sparse = np.zeros((levels, tour_len), dtype=np.int32)
+        sparse[0] = np.arange(tour_len)
+        for level in range(1, levels):
+            half = 1 << (level - 1)
+            length = tour_len - (1 << level) + 1
+            if length <= 0:
+                break
+            left = sparse[level - 1, :length]
+            right = sparse[level - 1, half:half + length]
+            sparse[level, :length] = np.where(
+                tour_depths[right] < tour_depths[left], right, left
+            )
+        self._euler_depths = tour_depths
+        self._euler_sparse = sparse
+
+    def _lca_pair_idx(self, left_idx, right_idx):
+        left = self._euler_first[left_idx]
+        right = self._euler_first[right_idx]
+        if left > right:
+            left, right = right, left
+        level = int(right - left + 1).bit_length() - 1
+        first_pos = self._euler_sparse[level, left]
+        second_pos = self._euler_sparse[level, right - (1 << level) + 1]
+        if self._euler_depths[second_pos] < self._euler_depths[first_pos]:
+            first_pos = second_pos
+        return int(self._euler_tour[first_pos])
+
+    def lca_pair(self, taxonomy_1, taxonomy_2):
+        """Returns the taxonomy ID of the lowest common ancestor of two taxonomies.
+
+        Answered in constant time as a range-minimum query over the Euler tour.
+
+        Args:
+            taxonomy_1 (str): taxonomy ID
+            taxonomy_2 (str): taxonomy ID
+
+        Returns:
+            str: taxonomy ID of the LCA
+        """
+        if self._euler_tour is None:
+            self._build_rmq()
+        lca_idx = self._lca_pair_idx(self.id_of[taxonomy_1], self.id_of[taxonomy_2])
+        return self.node_ids[lca_idx]
 
     def add_node(self, taxonomy, node_id, parent_id, tax_level):
-        """Adds node to tree dictionary.
+        """Adds node to the pending node mapping; only effective before the arrays
+        are built.
 
         Args:
             taxonomy (str): the taxonomy name
@@ -56,8 +250,8 @@ class Tree(object):
             tax_level (str): the taxonomic level for this node_id
 
         """
-        # taxonomy id to node mapping; ensures unique nodes despite non-unique names
-        self.tree[node_id] = Node(taxonomy, node_id, parent_id, tax_level)
+        # taxonomy id keyed; ensures unique nodes despite non-unique names
+        self._nodes[node_id] = (taxonomy, parent_id, tax_level)
 
     def lca(self, taxonomies, threshold=1.):
         """Returns the taxonomy of the LCA and optionally only use the top fraction of hits.
@@ -76,23 +270,66 @@ class Tree(object):
             # 10% as the minimum
             threshold = 0.1
 
-        count_target = len(taxonomies) * threshold
-        count_taxonomies = defaultdict(int)
-
+        id_of_get = self.id_of.get
+        # taxonomies represented in the reference database, but not present in the
+        # tree are skipped; a single .get per hit instead of a membership test
+        # plus a lookup
+        taxa_ids = []
         for taxonomy in taxonomies:
-            try:
-                current_taxonomy = self.tree[taxonomy].node_id
-            except AttributeError:
-                # dict when key not present
-                # taxonomy represented in the reference database, but is not present in the tree
-                continue
-            while not current_taxonomy == "1":
-                count_taxonomies[current_taxonomy] += 1
-                if count_taxonomies[current_taxonomy] >= count_target:
-                    return self.tree[current_taxonomy].node_id
-                # traverse up tree
-                current_taxonomy = self.tree[current_taxonomy].parent_id
-        return "1"
+            idx = id_of_get(taxonomy)
+            if idx is not None:
+                taxa_ids.append(idx)
+        if not taxa_ids:
+            return "1"
+        if threshold == 1:
+            # hits absent from the tree still count toward the total, so a full
+            # consensus is impossible once any hit was skipped
+            if len(taxa_ids) < len(taxonomies):
+                return "1"
+            # with full consensus required, hit order and multiplicity are
+            # irrelevant; a frozenset key collapses permutations of the same
+            # hits, and the answer is the plain LCA of the set
+            return self._lca_consensus_cached(frozenset(taxa_ids))
+        return self._lca_cached(tuple(taxa_ids), len(taxonomies) * threshold)
+
+    def _lca_impl(self, taxa_ids, count_target):
+        lca_id = lca_core(
+            self.parent,
+            np.fromiter(taxa_ids, dtype=np.int32, count=len(taxa_ids)),
+            self._lca_counts,
+            count_target,
+        )
+        return self.node_ids[lca_id]
+
+    def _lca_consensus_impl(self, taxa_ids):
+        # the full-consensus LCA is the pairwise LCA folded over the set, each
+        # step an O(1) range-minimum query over the Euler tour
+        if self._euler_tour is None:
+            self._build_rmq()
+        iterator = iter(taxa_ids)
+        lca_idx = next(iterator)
+        for taxon_idx in iterator:
+            if lca_idx == 0:
+                break
+            lca_idx = self._lca_pair_idx(lca_idx, taxon_idx)
+        return self.node_ids[lca_idx]
+
+    def is_ancestor(self, ancestor, taxonomy):
+        """Returns True when ancestor is taxonomy itself or one of its ancestors.
+
+        Args:
+            ancestor (str): taxonomy ID of the candidate ancestor
+            taxonomy (str): taxonomy ID of the node being tested
+
+        Returns:
+            bool
+        """
+        ancestor_idx = self.id_of[ancestor]
+        taxonomy_idx = self.id_of[taxonomy]
+        return (
+            self.tour_in[ancestor_idx] <= self.tour_in[taxonomy_idx]
+            and self.tour_in[taxonomy_idx] < self.tour_out[ancestor_idx]
+        )
 
     def filter_taxonomy_list(self, taxonomy_list, min_tree_depth=3):
         """Filters a taxonomy list by tree depth in an effort to classify at a higher resolution.
@@ -116,12 +353,7 @@ class Tree(object):
         """
         filtered_list = []
         for taxonomy in taxonomy_list:
-            tree_depth = 0
-            current_taxonomy = taxonomy
-            while not current_taxonomy == "1":
-                tree_depth += 1
-                current_taxonomy = self.tree[current_taxonomy].parent_id
-            if tree_depth < min_tree_depth:
+            if self.depth[self.id_of[taxonomy]] < min_tree_depth:
                 continue
             filtered_list.append(taxonomy)
         return filtered_list
@@ -145,12 +377,8 @@ class Tree(object):
         if taxonomy == "1":
             return [taxonomy]
 
-        lineage = [taxonomy]
-        while not taxonomy == "1":
-            taxonomy = self.tree[taxonomy].parent_id
-            # prepend
-            lineage.insert(0, taxonomy)
-        return lineage
+        node_ids = self.node_ids
+        return [node_ids[i] for i in self.lineage_of[self.id_of[taxonomy]]]
 
     def lca_majority(self, taxonomy_list, majority_cutoff):
         """Finds a consensus majority up a tree structure.
@@ -185,43 +413,20 @@ class Tree(object):
             lineage = self.taxonomic_lineage(taxonomy)
             lineage_counts.update(lineage)
             lineages[taxonomy] = lineage
-        lineage_indexes = index_of_list_items(lineages.values())
-        for taxonomy in lineage_indexes:
-            if lineage_counts[taxonomy] > majority_cutoff:
-                return taxonomy, lineages
-        return "1", lineages
-
-    def counts_to_majority_list(self, taxonomy_counts, lineages, majority_id):
-        """Aggregate the counts across lineage observations for the majority ID.
-
-        Args:
-            taxonomy_counts (collections.Counter): count per taxon
-            lineages (list): list of lineages per taxon
-            majority_id (str): the taxonomy name or ID upon which to aggregate counts
-
-        Returns:
-            list of representative taxonomies
-
-        Example:
-            >>> tree = Tree("ref/ncbi_taxonomy_tree.txt")
-            >>> taxonomy_list = ['gamma subgroup', 'RNA similarity group I',
-                                 'purple photosynthetic bacteria and relatives',
-                                 'not Bacteria Haeckel 1894',
-                                 'purple photosynthetic bacteria and relatives', 'gamma subgroup',
-                                 'gamma subgroup', 'purple photosynthetic bacteria and relatives',
-                                 'purple photosynthetic bacteria and relatives']
-            >>> majority_id, lineages = tree.lca_majority(taxonomy_list, 0.5 * len(taxonomy_list))
-            >>> tree.counts_to_majority_list(Counter(taxonomy_list), lineages, majority_id)
-            ['1224', '2', '1224', '1224', '1224', '1224', '1224', '1224', '1224']
-
-        """
-        aggregate_counts = []
-        for taxonomy, taxonomy_count in taxonomy_counts.items():
-            taxonomy_id = taxonomy
-            if majority_id in lineages[taxonomy_id]:
-                taxonomy_id = majority_id
-            aggregate_counts.extend([taxonomy_id] * taxonomy_count)
-        return aggregate_counts
+        # the majority is the deepest node exceeding the cutoff; a node's index in
+        # any lineage is its tree depth, so one scan over the depth array replaces
+        # the index-of-list-items build and sort
+        depth = self.depth
+        id_of = self.id_of
+        majority = "1"
+        majority_depth = -1
+        for taxonomy, count in lineage_counts.items():
+            if count > majority_cutoff:
+                taxonomy_depth = depth[id_of[taxonomy]]
+                if taxonomy_depth > majority_depth:
+                    majority_depth = taxonomy_depth
+                    majority = taxonomy
+        return majority, lineages
 
     def lca_star(self, taxonomy_list, min_tree_depth=3, majority_threshold=0.51):
         """Find the LCA within a list of taxonomies after filtering those taxonomies by tree depth.
@@ -251,6 +456,11 @@ class Tree(object):
             {'pvalue': 0.012791848981090311, 'taxonomy': '1224'}
 
         """
+        return self._lca_star_cached(
+            tuple(taxonomy_list), min_tree_depth, majority_threshold
+        )
+
+    def _lca_star_impl(self, taxonomy_list, min_tree_depth, majority_threshold):
         # tree depth based filter
         taxonomy_list = self.filter_taxonomy_list(taxonomy_list, min_tree_depth)
         # all have been filtered
@@ -267,17 +477,29 @@ class Tree(object):
             # create majority from lca
             else:
                 majority, lineages = self.lca_majority(taxonomy_list, majority_cutoff)
-                aggregate_counts = self.counts_to_majority_list(
-                    taxonomy_counts, lineages, majority
+                # fold counts_to_majority_list and the p-value's counting into one
+                # pass over the counter: counts of taxa under the majority collapse
+                # onto it, all others compete for the largest remaining count; the
+                # Euler-tour intervals make the under-majority test O(1) instead
+                # of a lineage membership scan
+                key_count = 0
+                max_other = 0
+                for taxonomy, taxonomy_count in taxonomy_counts.items():
+                    if self.is_ancestor(majority, taxonomy):
+                        key_count += taxonomy_count
+                    elif taxonomy_count > max_other:
+                        max_other = taxonomy_count
+                p = nettleton_pvalue_from_counts(
+                    key_count, max_other, len(taxonomy_list)
                 )
-                p = nettleton_pvalue(aggregate_counts, majority)
         return {"taxonomy": majority, "pvalue": p}
 
 
 class BlastHits(object):
     def __init__(self, names=None, max_hits=10, top_fraction=None):
-        """Class that represents BLAST hits for a single target sequence. Hits are added to queues
-        for bitscore and ID and ordered by increasing bitscore.
+        """Class that represents BLAST hits for a single target sequence. Hits are kept in a
+        fixed-size min-heap keyed on bitscore; :attr:`names` and :attr:`bitscores` expose them
+        ordered by increasing bitscore.
 
         Args:
             names (Optional[list]): when initiated with a name list; :func:`best_hit` and
@@ -321,20 +543,34 @@ class BlastHits(object):
             {'name_1': 100.0, 'name_6': 125.0}
 
         """
-        if names is None:
-            # increasing bitscore sorted
-            self.names = deque()
-            self.bitscores = deque()
-        else:
-            self.names = names
+        # min-heap of (bitscore, -insertion order, name); heap[0] is the worst
+        # hit, and among tied bitscores the newest sorts lowest so eviction and
+        # best_hit match the old bisect_left ordering
+        self._hits = []
+        self._order = 0
+        self._best_bitscore = 0.0
+        if names is not None:
+            for name in names:
+                self._order -= 1
+                self._hits.append((0.0, -self._order, name))
         self.max_hits = max_hits
         self.top_fraction = top_fraction
 
+    @property
+    def names(self):
+        """Hit IDs ordered by increasing bitscore."""
+        return deque(name for _, _, name in sorted(self._hits))
+
+    @property
+    def bitscores(self):
+        """Bitscores ordered by increasing bitscore."""
+        return deque(bitscore for bitscore, _, _ in sorted(self._hits))
+
     def __repr__(self):
         return "{cls}[{tax}]".format(cls=self.__class__.__name__, tax=self.names)
 
     def __len__(self):
-        return len(self.names)
+        return len(self._hits)
 
     def add(self, name, bitscore):
         """Add entry to this :class:`BlastHits` group.
@@ -346,48 +582,47 @@ class BlastHits(object):
         """
         bitscore = float(bitscore)
 
-        if self.top_fraction and self.bitscores:
+        if self.top_fraction and self._hits:
             # the filter
-            if bitscore < (self.bitscores[-1] * self.top_fraction):
+            if bitscore < (self._best_bitscore * self.top_fraction):
                 bitscore = None
-            # new best
-            elif bitscore > self.bitscores[-1]:
-                score = self.bitscores[0]
-                while score < bitscore * self.top_fraction:
-                    self.names.popleft()
-                    self.bitscores.popleft()
-                    score = self.bitscores[0]
+            # new best; drop hits that fall out of the updated window
+            elif bitscore > self._best_bitscore:
+                cutoff = bitscore * self.top_fraction
+                while self._hits and self._hits[0][0] < cutoff:
+                    heapq.heappop(self._hits)
 
         if bitscore:
-            # insert into sorted list
-            idx = bisect.bisect_left(self.bitscores, bitscore)
-            self.bitscores.insert(idx, bitscore)
-            self.names.insert(idx, name)
-            if len(self.names) > self.max_hits:
-                # remove lowest bitscore
-                self.names.popleft()
-                self.bitscores.popleft()
+            self._order += 1
+            entry = (bitscore, -self._order, name)
+            if len(self._hits) < self.max_hits:
+                heapq.heappush(self._hits, entry)
+            else:
+                # evict the lowest bitscore
+                heapq.heappushpop(self._hits, entry)
+            if bitscore > self._best_bitscore:
+                self._best_bitscore = bitscore
 
     def best_hit(self):
         """Returns the hit ID of the best scoring alignment."""
-        return self.names[-1]
+        return max(self._hits)[2]
 
     def majority(self):
         """Returns the hit ID of the best scoring hit ID that is repeated or the best hit when
         no items are repeated.
         """
+        names = self.names
         # no repeated names
-        if len(self.names) == len(set(self.names)):
+        if len(names) == len(set(names)):
             return self.best_hit()
         else:
             # count each taxonomy, grab top taxonomy
-            most_common = Counter(self.names).most_common(1)[0][0]
+            most_common = Counter(names).most_common(1)[0][0]
             # need to flip to grab best bitscore
-            names_reversed = self.names.copy()
-            names_reversed.reverse()
+            names.reverse()
             # left most index match
-            idx = names_reversed.index(most_common)
-            return names_reversed[idx]
+            idx = names.index(most_common)
+            return names[idx]
 
 
 def parse_blast_results_with_tree(
@@ -427,14 +662,37 @@ def parse_blast_results_with_tree(
         top_fraction_of_hits = None
 
     assert summary_method in ["lca", "best", "majority"]
-    contigs = defaultdict(dict)
+    # plain two-level dict; a defaultdict would also create entries on reads
+    contigs = {}
 
-    with contextlib.closing(sqlite3.connect(name_map)) as conn, gzopen(
-        blast_tab
-    ) as blast_tab_fh:
+    # column indexes into the split HSP once the contig column is removed; avoids
+    # building a dict per HSP
+    sseqid_idx = BLAST6.index("sseqid")
+    evalue_idx = BLAST6.index("evalue")
+    bitscore_idx = BLAST6.index("bitscore")
+
+    with contextlib.closing(sqlite3.connect(name_map)) as conn:
         cursor = conn.cursor()
-        # group hits by ORF (column 2)
-        for orf_id, qgroup in groupby(blast_tab_fh, key=lambda x: x.split("\t")[1]):
+
+        # popular reference proteins are hit by many ORFs; memoizing saves the
+        # sqlite round trip per repeated subject
+        @functools.lru_cache(maxsize=1000000)
+        def annotation_of(sseqid):
+            cursor.execute(
+                'SELECT function, taxonomy FROM %s WHERE name="%s"'
+                % (table_name, sseqid)
+            )
+            function, taxonomy = cursor.fetchone()
+            # sqlite returns a fresh string per row; interning collapses the few
+            # distinct taxonomies to shared objects with memoized hashes, so the
+            # id_of translation inside lca stays cheap
+            return function, sys.intern(taxonomy)
+
+        # group pre-filtered rows by ORF (column 2)
+        rows = _iter_blast_rows(
+            blast_tab, min_identity, min_bitscore, min_length, max_evalue
+        )
+        for orf_id, qgroup in groupby(rows, key=lambda x: x[0][1]):
 
             protein_function = "hypothetical protein"
             protein_set = False
@@ -447,71 +705,57 @@ def parse_blast_results_with_tree(
             lines = []
 
             # iterate over blast hits per ORF
-            for hsp in qgroup:
-                # HSPs will now have contig in column 1
-                toks = hsp.strip().split("\t")
-                # remove extra column from toks
+            for toks, passed in qgroup:
+                # HSPs will now have contig in column 1; remove it from toks
                 contig_name = toks.pop(0)
-                # convert toks to dictionary
-                toks = dict(zip(BLAST6, toks))
-
-                if (
-                    int(toks["length"]) < min_length
-                    or float(toks["pident"]) < min_identity
-                    or float(toks["evalue"]) > max_evalue
-                ):
+
+                # numeric thresholds already applied vectorized during the read
+                if not passed:
                     continue
-                if min_bitscore and float(toks["bitscore"]) < min_bitscore:
-                    # input is sorted by decreasing bitscore
-                    break
 
-                cursor.execute(
-                    'SELECT function, taxonomy FROM %s WHERE name="%s"'
-                    % (table_name, toks["sseqid"])
-                )
-                current_function, current_taxonomy = cursor.fetchone()
+                current_function, current_taxonomy = annotation_of(toks[sseqid_idx])
 
                 # update taxonomy based on pident; would be similar to 16S taxonomy assignments
-                # current_taxonomy = tree.climb_tree(current_taxonomy, float(toks["pident"]))
+                # current_taxonomy = tree.climb_tree(current_taxonomy, float(toks[pident_idx]))
 
                 if summary_method == "best":
                     taxonomy_id = current_taxonomy
                     protein_function = current_function
-                    bitscore = toks["bitscore"]
-                    evalue = toks["evalue"]
+                    bitscore = toks[bitscore_idx]
+                    evalue = toks[evalue_idx]
                     break
 
                 # TODO implement bitscore ratio as a measure of alignment quality as a function of input sequence
-                orf_hits.add(current_taxonomy, toks["bitscore"])
-                toks["current_function"] = current_function
-                toks["current_taxonomy"] = current_taxonomy
-                lines.append(toks)
+                orf_hits.add(current_taxonomy, toks[bitscore_idx])
+                lines.append(
+                    (toks[bitscore_idx], toks[evalue_idx], current_function, current_taxonomy)
+                )
 
             # summary method is majority and we have passing HSPs
             if not summary_method == "best" and lines:
                 if summary_method == "majority":
                     taxonomy_id = orf_hits.majority()
-                    for toks in lines:
-                        if toks["current_taxonomy"] == taxonomy_id:
-                            bitscore = toks["bitscore"]
-                            evalue = toks["evalue"]
-                            protein_function = toks["current_function"]
+                    for hit_bitscore, hit_evalue, hit_function, hit_taxonomy in lines:
+                        if hit_taxonomy == taxonomy_id:
+                            bitscore = hit_bitscore
+                            evalue = hit_evalue
+                            protein_function = hit_function
                             break
                 # summary method is 'lca'
                 else:
-                    orf_hits.names.reverse()
-                    taxonomy_id = tree.lca(orf_hits.names, threshold=lca_threshold)
+                    # decreasing bitscore order for the threshold-based LCA
+                    names = orf_hits.names
+                    names.reverse()
+                    taxonomy_id = tree.lca(names, threshold=lca_threshold)
                     # grabbing best hit's bitscore and evalue
-                    bitscore = lines[0]["bitscore"]
-                    evalue = lines[0]["evalue"]
-                    protein_function = lines[0]["current_function"]
+                    bitscore, evalue, protein_function = lines[0][:3]
 
                 if bitscore == "NA":
                     logging.critical(
                         "The summarized ID (%s) was not assigned metadata" % taxonomy_id
                     )
 
-            contigs[contig_name][orf_id] = (
+            contigs.setdefault(contig_name, {})[orf_id] = (
                 protein_function,
                 taxonomy_id,
                 bitscore,
@@ -537,6 +781,54 @@ def validate_lineage(lineage, sep=";"):
     return sep.join(valid_lineage)
 
 
+def _contig_rows(tree, contig, orfs, aggregation_method, majority_threshold):
+    """Classify one contig from its ORF assignments and format its output rows."""
+    taxonomies = [x[1] for x in orfs.values()]
+    if aggregation_method == "lca-majority":
+        res = tree.lca_star(taxonomies, majority_threshold=majority_threshold)
+        contig_taxonomy = res["taxonomy"]
+        error_function = res["pvalue"]
+    elif aggregation_method == "lca":
+        # TODO incorporate threshold into LCAs?
+        contig_taxonomy = tree.lca(taxonomies)
+        error_function = _nettleton_pvalue_cached(tuple(taxonomies), contig_taxonomy)
+    # simple majority
+    else:
+        contig_taxonomy = BlastHits(taxonomies).majority()
+        error_function = _nettleton_pvalue_cached(tuple(taxonomies), contig_taxonomy)
+    lineage = {}
+    for item in tree.taxonomic_lineage(contig_taxonomy):
+        item_idx = tree.id_of[item]
+        tax_level = tree.tax_level[item_idx]
+        if tax_level in TAX_LEVELS:
+            # does not account for "no rank" and some other cases of "unclassified"
+            lineage[
+                "k" if tax_level == "superkingdom" else tax_level[0]
+            ] = tree.name[item_idx]
+    lineage = validate_lineage(lineage)
+
+    rows = []
+    for idx in sorted(orfs.keys()):
+        orf_function, orf_tax_id, bitscore, evalue = orfs[idx]
+        orf_taxonomy = tree.name[tree.id_of[orf_tax_id]]
+        rows.append(
+            f"{contig}\t{idx}\t{lineage}\t{error_function}\t{orf_taxonomy}"
+            f"\t{orf_function}\t{evalue}\t{bitscore}"
+        )
+    return rows
+
+
+# tree shared with forked pool workers; set before the pool is created
+_worker_tree = None
+
+
+def _contig_rows_worker(item, aggregation_method, majority_threshold):
+    contig, orfs = item
+    return _contig_rows(
+        _worker_tree, contig, orfs, aggregation_method, majority_threshold
+    )
+
+
 def process_orfs_with_tree(
     orf_assignments,
     tree,
@@ -544,6 +836,7 @@ def process_orfs_with_tree(
     aggregation_method,
     majority_threshold=0.51,
     table_name="refseq",
+    threads=1,
 ):
     """Processing the already classified ORFs through secondary contig classification.
 
@@ -553,6 +846,7 @@ def process_orfs_with_tree(
         output (filehandle): output file handle
         aggregation_method (str): lca, lca-majority, or majority
         majority_threshold (float): constitutes a majority fraction at tree node for 'lca-majority' ORF aggregation method
+        threads (int): worker processes across which contigs are aggregated
     """
     print(
         "contig",
@@ -566,42 +860,35 @@ def process_orfs_with_tree(
         sep="\t",
         file=output,
     )
-    for contig, orfs in orf_assignments.items():
-        taxonomies = [x[1] for x in orfs.values()]
-        if aggregation_method == "lca-majority":
-            res = tree.lca_star(taxonomies, majority_threshold=majority_threshold)
-            contig_taxonomy = res["taxonomy"]
-            error_function = res["pvalue"]
-        elif aggregation_method == "lca":
-            # TODO incorporate threshold into LCAs?
-            contig_taxonomy = tree.lca(taxonomies)
-            error_function = nettleton_pvalue(taxonomies, contig_taxonomy)
-        # simple majority
-        else:
-            contig_taxonomy = BlastHits(taxonomies).majority()
-            error_function = nettleton_pvalue(taxonomies, contig_taxonomy)
-        lineage = {}
-        for item in tree.taxonomic_lineage(contig_taxonomy):
-            node = tree.tree[item]
-            if node.tax_level in TAX_LEVELS:
-                # does not account for "no rank" and some other cases of "unclassified"
-                lineage[
-                    "k" if node.tax_level == "superkingdom" else node.tax_level[0]
-                ] = node.taxonomy
-        lineage = validate_lineage(lineage)
-
-        for idx in sorted(orfs.keys()):
-            orf_function, orf_tax_id, bitscore, evalue = orfs[idx]
-            orf_taxonomy = tree.tree[orf_tax_id].taxonomy
-            print(
-                contig,
-                idx,
-                lineage,
-                error_function,
-                orf_taxonomy,
-                orf_function,
-                evalue,
-                bitscore,
-                sep="\t",
-                file=output,
+    # batch rows into few large writes rather than a print call per ORF
+    buffered_lines = []
+    buffer_limit = 50000
+    if threads > 1:
+        global _worker_tree
+        _worker_tree = tree
+        worker = functools.partial(
+            _contig_rows_worker,
+            aggregation_method=aggregation_method,
+            majority_threshold=majority_threshold,
+        )
+        # fork so workers inherit the tree instead of pickling it per task
+        with multiprocessing.get_context("fork").Pool(threads) as pool:
+            row_groups = pool.imap(worker, orf_assignments.items(), chunksize=100)
+            for rows in row_groups:
+                buffered_lines.extend(rows)
+                if len(buffered_lines) >= buffer_limit:
+                    output.write("\n".join(buffered_lines) + "\n")
+                    buffered_lines.clear()
+        _worker_tree = None
+    else:
+        for contig, orfs in orf_assignments.items():
+            buffered_lines.extend(
+                _contig_rows(tree, contig, orfs, aggregation_method, majority_threshold)
             )
+            if len(buffered_lines) >= buffer_limit:
+                output.write("\n".join(buffered_lines) + "\n")
+                buffered_lines.clear()
+    if buffered_lines:
+        output.write("\n".join(buffered_lines) + "\n")
+    logging.debug("LCA cache: %s" % (tree._lca_cached.cache_info(),))
+    logging.debug("LCA star cache: %s" % (tree._lca_star_cached.cache_info(),))
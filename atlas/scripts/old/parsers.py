@@ -1,11 +1,12 @@
 import contextlib
 import gzip
 import logging
+import os
 import sqlite3
 from itertools import groupby
 
 from atlas import BLAST6
-from atlas.blast import (BlastHits, Node, Tree, parse_blast_results_with_tree,
+from atlas.blast import (BlastHits, Tree, parse_blast_results_with_tree,
                          process_orfs_with_tree)
 from atlas.utils import gzopen
 
@@ -26,6 +27,7 @@ def refseq_parser(
     max_hits,
     table_name,
     top_fraction,
+    threads=None,
 ):
     """Parse TSV (tabular BLAST output [-outfmt 6]), grabbing taxonomy metadata from ANNOTATION to
     compute LCAs.
@@ -68,6 +70,7 @@ def refseq_parser(
         top_fraction (float): filters ORF BLAST hits before finding majority by only keep hits within this fraction, e.g. 0.98, of the highest bitscore
         max_hits (int): maximum number of BLAST hits to consider when summarizing ORFs as a majority
         table_name (str): table name within namemap database; expected columns are listed above
+        threads (Optional[int]): worker processes for contig aggregation; all cores when omitted
 
     """
     logging.info("Parsing %s" % tsv)
@@ -93,6 +96,7 @@ def refseq_parser(
         aggregation_method,
         majority_threshold,
         table_name,
+        threads=threads or os.cpu_count() or 1,
     )
     logging.info("Complete")
 
@@ -334,12 +334,14 @@ def prepare_refseq_reference(fasta, namesdmp, nodesdmp, namemap, tree):
     logging.info("Iterating over %s" % fasta)
     with gzip.open(fasta, 'rt') as fa:
         for name, seq in read_fasta(fa):
-            name_parts = name.partition(" ")
+            seq_id, _, description = name.partition(" ")
             # biotin--[acetyl-CoA-carboxylase] synthetase [Aeromonas allosaccharophila]
-            function = name_parts[2].rpartition("[")[0].strip()
-            taxonomy_name = name_parts[2].rpartition("[")[2].strip("]").replace("'","").replace('"','')
+            # scan for the last bracket once rather than rpartitioning twice
+            bracket_idx = description.rfind("[")
+            function = description[:bracket_idx].strip() if bracket_idx > -1 else ""
+            taxonomy_name = description[bracket_idx + 1:].strip("]").replace("'","").replace('"','')
             # phosphoribosyltransferase [[Haemophilus] parasuis]
-            if "[[" in name_parts[2]:
+            if "[[" in description:
                 taxonomy_name = "[%s" % taxonomy_name
             # https://www.ncbi.nlm.nih.gov/Taxonomy/Browser/wwwtax.cgi?lvl=0&id=1737424
             if taxonomy_name == "Blautia sp. GD8":
@@ -352,7 +354,7 @@ def prepare_refseq_reference(fasta, namesdmp, nodesdmp, namemap, tree):
                 taxonomy_name = taxonomy_name.replace("]", "").replace("[", "")
                 taxonomy_id = name_to_tax[taxonomy_name]
 
-            print(name_parts[0], function, taxonomy_id, sep="\t", file=namemap)
+            print(seq_id, function, taxonomy_id, sep="\t", file=namemap)
 
     logging.info("Reading in %s" % nodesdmp)
     with open(nodesdmp) as dmp:
@@ -1,5 +1,5 @@
 import os
-from collections import Counter, OrderedDict
+from collections import Counter
 from math import erfc, log, sqrt
 
 gzopen = lambda f: gzip.open(f, mode="rt") if f.endswith(".gz") else open(f)
@@ -16,44 +16,6 @@ def touch(fname, mode=0o666, dir_fd=None, **kwargs):
         )
 
 
-def index_of_list_items(lists):
-    """Find the highest index for items among list of lists and return ordered dictionary sorted by
-    decreasing index value.
-
-    Args:
-        lists (list): list of lists
-
-    Returns:
-        OrderedDict of list items, sorted by depth with deepest list item first
-
-    Example:
-        >>> lineages = [['1', '131567', '99999999', '2'],
-                        ['1', '131567', '99999999', '2', '1224', '1236', '72274', '135621', '286'],
-                        ['1', '131567', '99999999', '2', '1224'],
-                        ['1', '131567', '99999999', '2', '1224', '1236']]
-        >>> index_of_list_items(lineages)
-        OrderedDict([('286', 8),
-                     ('135621', 7),
-                     ('72274', 6),
-                     ('1236', 5),
-                     ('1224', 4),
-                     ('2', 3),
-                     ('99999999', 2),
-                     ('131567', 1),
-                     ('1', 0)])
-
-    """
-    indexes = {}
-    for l in lists:
-        for i, item in enumerate(l):
-            if item in indexes:
-                if indexes[item] < i:
-                    indexes[item] = i
-            else:
-                indexes[item] = i
-    return OrderedDict(sorted(indexes.items(), key=lambda t: t[1], reverse=True))
-
-
 def nettleton_pvalue(items, key):
     """Calculate pvalue based on Nettleton result.
 
@@ -68,34 +30,37 @@ def nettleton_pvalue(items, key):
         AssertionError when key is not present in items
     """
     assert key in items
-    if len(items) == 1:
-        return 1
-
     item_counts = Counter(items)
-    if item_counts.most_common()[0][0] == key:
-        try:
-            # take second entries count value
-            max_count = item_counts.most_common()[1][1]
-        except IndexError:
-            max_count = 0
-    else:
-        # take first entries count value
-        max_count = item_counts.most_common()[0][1]
-    if item_counts[key] <= max_count:
+    key_count = item_counts[key]
+    # largest count among the other keys
+    max_count = max(
+        (count for item, count in item_counts.items() if not item == key), default=0
+    )
+    return nettleton_pvalue_from_counts(key_count, max_count, len(items))
+
+
+def nettleton_pvalue_from_counts(key_count, max_count, total):
+    """Calculate pvalue based on Nettleton result from pre-aggregated counts,
+    without materializing the observation list.
+
+    Args:
+        key_count (int): number of observations of the key being tested
+        max_count (int): largest observation count among the other items
+        total (int): total number of observations
+
+    Returns:
+        float
+    """
+    if total == 1:
         return 1
-    else:
-        try:
-            t = 2 * (
-                max_count * log((2 * max_count) / (max_count + item_counts[key]))
-                + (
-                    item_counts[key]
-                    * log((2 * item_counts[key] / (max_count + item_counts[key])))
-                )
-            )
-        except ValueError:
-            # max_count = 0
-            t = 2 * (
-                item_counts[key]
-                * log((2 * item_counts[key] / (max_count + item_counts[key])))
-            )
-        return erfc(sqrt(t / 2))
+    if key_count <= max_count:
+        return 1
+    try:
+        t = 2 * (
+            max_count * log((2 * max_count) / (max_count + key_count))
+            + (key_count * log((2 * key_count / (max_count + key_count))))
+        )
+    except ValueError:
+        # max_count = 0
+        t = 2 * (key_count * log((2 * key_count / (max_count + key_count))))
+    return erfc(sqrt(t / 2))